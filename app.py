@@ -1,9 +1,17 @@
+import html
+import json
+import logging
+import re
 import sys
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from bs4 import BeautifulSoup, SoupStrainer
+
+from http_utils import RateLimiter, get_with_retries, make_client, stream_with_retries, url_key
 
 # ---------- CONFIG ----------
 BASE_URL = "https://www.woodlands.co.uk"
@@ -11,7 +19,9 @@ SEARCH_TEMPLATE = (
     "https://www.woodlands.co.uk/buying-a-wood/search?location=HP11SW&page={page}"
 )
 SAVE_DIR = Path(r"C:\Users\thoma\OneDrive\Documents\Repositories\Glamping")
-REQUEST_DELAY_SEC = 1  # be polite
+CACHE_FILE = SAVE_DIR / "pdf_cache.json"  # url -> ETag / Last-Modified / path
+MAX_WORKERS = 8        # concurrent in-flight requests
+REQUESTS_PER_SEC = 2   # be polite: global cap shared by all workers
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
                   "AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -20,13 +30,19 @@ HEADERS = {
 }
 # ----------------------------
 
-def get_response(url: str) -> requests.Response:
-    print(f"[GET] {url}")
-    resp = requests.get(url, headers=HEADERS, timeout=30)
-    return resp
+log = logging.getLogger("scrape")
+
+CLIENT = make_client(HEADERS)
+RATE_LIMIT = RateLimiter(REQUESTS_PER_SEC)
+
+def get_response(url: str) -> httpx.Response:
+    return get_with_retries(CLIENT, RATE_LIMIT, url)
 
-def soup_of(resp: requests.Response) -> BeautifulSoup:
-    return BeautifulSoup(resp.text, "html.parser")
+# Search pages only need the H1 (404 check) and the card anchors
+SEARCH_STRAINER = SoupStrainer(["h1", "a"])
+
+def soup_of(resp: httpx.Response, parse_only: SoupStrainer | None = None) -> BeautifulSoup:
+    return BeautifulSoup(resp.content, "lxml", parse_only=parse_only)
 
 def page_is_404(soup: BeautifulSoup, status: int) -> bool:
     """Detect the 404 page either by status code or by the H1 text you showed."""
@@ -39,99 +55,149 @@ def page_is_404(soup: BeautifulSoup, status: int) -> bool:
 
 def find_all_card_links(soup: BeautifulSoup):
     links = [urljoin(BASE_URL, a["href"]) for a in soup.select("a.card__link[href]")]
-    print(f"[INFO] Found {len(links)} woodland card links on this page.")
-    for link in links:
-        print(f"       -> {link}")
+    log.info(f"[INFO] Found {len(links)} woodland card links on this page.")
+    if log.isEnabledFor(logging.DEBUG):
+        for link in links:
+            log.debug(f"       -> {link}")
     return links
 
-def find_pdf_link_on_detail_page(soup: BeautifulSoup) -> str:
-    # Prefer the explicit button text
-    for a in soup.select('a[href]'):
-        if "download pdf details" in a.get_text(strip=True).lower():
-            return urljoin(BASE_URL, a["href"])
-    # Fallback: any .pdf link
-    a = soup.select_one('a[href$=".pdf"]')
-    if a:
-        return urljoin(BASE_URL, a["href"])
-    raise RuntimeError("No PDF link found on detail page.")
+# Detail pages are only scanned for the PDF link, so skip HTML parsing entirely
+PDF_BUTTON_RE = re.compile(
+    rb"""<a\b[^>]*?\bhref=["']([^"']+)["'][^>]*>(?:(?!</a>).)*?download\s+pdf\s+details""",
+    re.IGNORECASE | re.DOTALL,
+)
+ANY_PDF_RE = re.compile(rb"""<a\b[^>]*?\bhref=["']([^"']+\.pdf)["']""", re.IGNORECASE)
+
+def find_pdf_link_on_detail_page(content: bytes) -> str:
+    # Prefer the explicit button text; fallback: any .pdf link
+    m = PDF_BUTTON_RE.search(content) or ANY_PDF_RE.search(content)
+    if not m:
+        raise RuntimeError("No PDF link found on detail page.")
+    href = html.unescape(m.group(1).decode("utf-8", "replace"))
+    return urljoin(BASE_URL, href)
+
+PDF_CACHE: dict[str, dict] = {}
+PDF_CACHE_LOCK = threading.Lock()
+
+def load_pdf_cache(path: Path) -> dict[str, dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_pdf_cache(path: Path) -> None:
+    with PDF_CACHE_LOCK:
+        data = json.dumps(PDF_CACHE, indent=1)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(data, encoding="utf-8")
 
 def download_file(url: str, dest_dir: Path) -> Path:
     dest_dir.mkdir(parents=True, exist_ok=True)
     name = Path(urlparse(url).path).name or "details.pdf"
     dest = dest_dir / name
-    if dest.exists():
-        print(f"[SKIP] Already exists: {dest}")
-        return dest
 
-    print(f"[DOWNLOAD] {url} -> {dest}")
-    with requests.get(url, headers=HEADERS, timeout=60, stream=True) as r:
+    # Conditional GET: a 304 means our copy is current and no body is sent
+    headers = {}
+    if dest.exists():
+        with PDF_CACHE_LOCK:
+            entry = PDF_CACHE.get(url) or {}
+        if entry.get("path") != str(dest):
+            entry = {}  # no validators for this file; fall back to its mtime
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        headers["If-Modified-Since"] = (
+            entry.get("last_modified") or formatdate(dest.stat().st_mtime, usegmt=True)
+        )
+
+    log.info(f"[DOWNLOAD] {url} -> {dest}")
+    with stream_with_retries(CLIENT, RATE_LIMIT, url, headers) as r:
+        if r.status_code == 304:
+            log.info(f"[SKIP] Not modified: {dest}")
+            return dest
         r.raise_for_status()
-        size = 0
         with open(dest, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    size += len(chunk)
-    print(f"[SAVED] {dest} ({size} bytes)")
+            for chunk in r.iter_bytes(chunk_size=1024 * 1024):
+                f.write(chunk)
+        with PDF_CACHE_LOCK:
+            PDF_CACHE[url] = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "path": str(dest),
+            }
+    log.info(f"[SAVED] {dest} ({dest.stat().st_size} bytes)")
     return dest
 
+def process_detail(detail_url: str, label: str) -> bool:
+    """Fetch one woodland page and download its PDF. Returns True on success."""
+    log.debug(f"=== {label} ===")
+    try:
+        d_resp = get_response(detail_url)
+        d_resp.raise_for_status()
+        pdf_url = find_pdf_link_on_detail_page(d_resp.content)
+        log.info(f"[PDF] {pdf_url}")
+        download_file(pdf_url, SAVE_DIR)
+        return True
+    except Exception as e:
+        log.error(f"[ERROR] Failed on {detail_url}: {e}")
+        return False
+
 def main():
     seen_detail_pages = set()
     page = 1
     total_downloads = 0
+    PDF_CACHE.update(load_pdf_cache(CACHE_FILE))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_search = prefetcher.submit(get_response, SEARCH_TEMPLATE.format(page=page))
+        while True:
+            resp = next_search.result()
+            soup = soup_of(resp, SEARCH_STRAINER)
+
+            # Stop when we hit the 404 page
+            if page_is_404(soup, resp.status_code):
+                log.info(f"[STOP] Page {page} appears to be 404 / end of results. Finishing.")
+                break
 
-    while True:
-        search_url = SEARCH_TEMPLATE.format(page=page)
-        resp = get_response(search_url)
-        soup = soup_of(resp)
-
-        # Stop when we hit the 404 page
-        if page_is_404(soup, resp.status_code):
-            print(f"[STOP] Page {page} appears to be 404 / end of results. Finishing.")
-            break
-
-        try:
-            detail_links = find_all_card_links(soup)
-        except Exception as e:
-            print(f"[WARN] Could not parse links on page {page}: {e}")
-            break
-
-        if not detail_links:
-            print(f"[STOP] No woodland cards found on page {page}.")
-            break
-
-        for i, detail_url in enumerate(detail_links, start=1):
-            if detail_url in seen_detail_pages:
-                print(f"[SKIP] Already processed: {detail_url}")
-                continue
-            seen_detail_pages.add(detail_url)
-
-            print(f"\n=== Page {page} — Woodland {i}/{len(detail_links)} ===")
             try:
-                d_resp = get_response(detail_url)
-                d_resp.raise_for_status()
-                d_soup = soup_of(d_resp)
-                pdf_url = find_pdf_link_on_detail_page(d_soup)
-                print(f"[PDF] {pdf_url}")
-                download_file(pdf_url, SAVE_DIR)
-                total_downloads += 1
+                detail_links = find_all_card_links(soup)
             except Exception as e:
-                print(f"[ERROR] Failed on {detail_url}: {e}")
-            finally:
-                time.sleep(REQUEST_DELAY_SEC)
+                log.warning(f"[WARN] Could not parse links on page {page}: {e}")
+                break
+
+            if not detail_links:
+                log.info(f"[STOP] No woodland cards found on page {page}.")
+                break
+
+            # Fetch the next results page while this page's details are processed
+            next_search = prefetcher.submit(get_response, SEARCH_TEMPLATE.format(page=page + 1))
+
+            jobs = []
+            for i, detail_url in enumerate(detail_links, start=1):
+                key = url_key(detail_url)
+                if key in seen_detail_pages:
+                    log.info(f"[SKIP] Already processed: {detail_url}")
+                    continue
+                seen_detail_pages.add(key)
+                jobs.append((detail_url, f"Page {page} — Woodland {i}/{len(detail_links)}"))
+
+            # Detail pages are independent: fetch them concurrently, paced by RATE_LIMIT
+            total_downloads += sum(executor.map(lambda job: process_detail(*job), jobs))
+            save_pdf_cache(CACHE_FILE)
 
-        page += 1
-        print(f"\n[PAGE] Moving to page {page}...\n")
-        time.sleep(REQUEST_DELAY_SEC)
+            page += 1
+            log.info(f"[PAGE] Moving to page {page}...")
 
-    print(f"\n[DONE] Finished. PDFs downloaded: {total_downloads}")
+    log.info(f"[DONE] Finished. PDFs downloaded: {total_downloads}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # we log our own [GET] lines
     try:
         main()
     except KeyboardInterrupt:
-        print("\n[INTERRUPTED] User stopped the script.")
+        log.info("[INTERRUPTED] User stopped the script.")
         sys.exit(1)
     except Exception as e:
-        print("[FATAL]", e)
+        log.error(f"[FATAL] {e}")
         sys.exit(1)
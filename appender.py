@@ -1,47 +1,64 @@
 import re
 import argparse
-import math
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
+try:  # optional: only pays for its JIT warm-up on very large catalogs
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 FRACTIONS = {
     "½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1/3, "⅔": 2/3,
 }
 
 ACRE_TO_M2 = 4046.8564224  # 1 acre in square metres
+NUMBA_MIN_ROWS = 100_000   # below this, np.where beats the JIT kernel
+
+# Compiled once and applied column-wide by parse_acres
+_FLUFF_RE = re.compile(r"\b(about|approx(?:imately)?|over|just over|c\.)\b")
+_MIXED_FRAC_RE = re.compile(r"(\d+)\s+(\d+)\s*/\s*(\d+)")
+_PLUS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:\+\s*(0?\.\d+))?")
+_FRACTIONS_TABLE = str.maketrans({sym: f" +{dec}" for sym, dec in FRACTIONS.items()})
+
+if njit is not None:
+    # No fastmath: it assumes NaN-free input and could fold away the isnan test
+    @njit(cache=True, parallel=True)
+    def _combine_acres(whole, num, den, base, frac, out):
+        for i in prange(out.shape[0]):
+            if not np.isnan(whole[i]):
+                out[i] = whole[i] + num[i] / den[i]
+            else:
+                out[i] = base[i] + frac[i]
+else:
+    _combine_acres = None
 
-def parse_acres(text: str | float) -> float | None:
-    """Turn 'about 2 ½ acres' or '1 3/4 acres' into numeric acres."""
-    if pd.isna(text):
-        return None
-    s = str(text).lower()
+def parse_acres(sizes: pd.Series) -> pd.Series:
+    """Turn a column of 'about 2 ½ acres' / '1 3/4 acres' into numeric acres (NaN if unparseable)."""
+    s = sizes.astype("string").str.lower()
     # remove fluff words
-    s = re.sub(r"\b(about|approx(?:imately)?|over|just over|c\.)\b", "", s)
-    s = s.replace("acres", "").replace("acre", "").strip()
+    s = s.str.replace(_FLUFF_RE, "", regex=True)
+    s = s.str.replace("acres", "", regex=False).str.replace("acre", "", regex=False).str.strip()
 
     # vulgar fractions → +decimal
-    for sym, dec in FRACTIONS.items():
-        s = s.replace(sym, f" +{dec}")
+    s = s.str.translate(_FRACTIONS_TABLE)
 
     # ascii mixed fraction "1 3/4"
-    m = re.search(r"(\d+)\s+(\d+)\s*/\s*(\d+)", s)
-    if m:
-        whole = float(m.group(1))
-        num = float(m.group(2))
-        den = float(m.group(3)) if float(m.group(3)) != 0 else 1.0
-        return whole + (num/den)
-
-    # "a +0.5" pattern
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:\+\s*(0?\.\d+))?", s)
-    if m:
-        base = float(m.group(1))
-        frac = float(m.group(2)) if m.lastindex and m.group(2) else 0.0
-        return base + frac
-
-    # simple float fallback
-    m = re.search(r"(-?\d+(?:\.\d+)?)", s)
-    return float(m.group(1)) if m else None
+    mixed = s.str.extract(_MIXED_FRAC_RE).astype("float64")
+    whole, num, den = mixed[0], mixed[1], mixed[2].replace(0, 1.0)
+
+    # "a +0.5" pattern (any digit run matches, so no separate float fallback is needed)
+    plus = s.str.extract(_PLUS_RE).astype("float64")
+    base, frac = plus[0], plus[1].fillna(0.0)
+
+    if _combine_acres is not None and len(s) >= NUMBA_MIN_ROWS:
+        acres = np.empty(len(s), dtype=np.float64)
+        _combine_acres(*(c.to_numpy(dtype=np.float64) for c in (whole, num, den, base, frac)), acres)
+    else:
+        acres = np.where(whole.notna(), whole + num / den, base + frac)
+    return pd.Series(acres, index=sizes.index, dtype="float64")
 
 def main():
     ap = argparse.ArgumentParser(description="Normalize Size to numeric acres, m², and sqrt(m²).")
@@ -56,7 +73,14 @@ def main():
     if not path.exists():
         raise SystemExit(f"File not found: {path}")
 
-    df = pd.read_csv(path, encoding="utf-8-sig")
+    # Low-cardinality / text columns get compact dtypes up front
+    df = pd.read_csv(
+        path,
+        encoding="utf-8-sig",
+        engine="pyarrow",  # multi-threaded C++ reader
+        dtype={"Type": "category", "Name": "string"},
+    )
+    mem_before = df.memory_usage(deep=True).sum()
 
     if "Size" not in df.columns:
         raise SystemExit("Column 'Size' not found in CSV.")
@@ -67,9 +91,12 @@ def main():
     print(f"[backup] {backup}")
 
     # normalize
-    df["SizeAcres"] = df["Size"].apply(parse_acres)
+    df["SizeAcres"] = parse_acres(df["Size"])
     df["Size_m2"] = df["SizeAcres"] * ACRE_TO_M2
-    df["Size_m2_sqrt"] = df["Size_m2"].apply(lambda x: math.sqrt(x) if pd.notna(x) else None)
+    df["Size_m2_sqrt"] = np.sqrt(df["Size_m2"].to_numpy(dtype="float64"))  # NaN propagates
+    # float32 is plenty for derived sizes (~7 significant digits)
+    df = df.astype({"SizeAcres": "float32", "Size_m2": "float32", "Size_m2_sqrt": "float32"})
+    print(f"[memory] {mem_before:,} -> {df.memory_usage(deep=True).sum():,} bytes")
 
     df.to_csv(path, index=False, encoding="utf-8-sig")
     print(f"[done]   updated {path}")
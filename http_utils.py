@@ -0,0 +1,75 @@
+"""HTTP plumbing shared by the scrapers (app.py, locations.py) and the map app."""
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import httpx
+import xxhash
+
+log = logging.getLogger("scrape")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+
+class RateLimiter:
+    """Thread-safe pacing: hands out one request slot every 1/rate seconds."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+def make_client(headers: dict) -> httpx.Client:
+    """One pooled HTTP/2 client: concurrent requests multiplex over a single TLS connection."""
+    return httpx.Client(
+        headers=headers,
+        follow_redirects=True,
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=3,  # connection failures; status retries are handled in get_with_retries()
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=8),
+        ),
+    )
+
+def get_with_retries(
+    client: httpx.Client, limiter: RateLimiter, url: str, headers: dict | None = None, timeout: float = 30
+) -> httpx.Response:
+    """Paced GET that backs off and retries on 429/5xx; the last response is returned as-is."""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        log.info(f"[GET] {url}")
+        resp = client.get(url, headers=headers, timeout=timeout)
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return resp
+        time.sleep(2 ** attempt)  # back off before retrying 429/5xx
+
+@contextmanager
+def stream_with_retries(
+    client: httpx.Client, limiter: RateLimiter, url: str, headers: dict | None = None, timeout: float = 60
+) -> Iterator[httpx.Response]:
+    """Streaming counterpart of get_with_retries: yields the open response, body unread."""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        with client.stream("GET", url, headers=headers, timeout=timeout) as resp:
+            if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                yield resp
+                return
+            log.info(f"[RETRY] {resp.status_code} for {url}")
+        time.sleep(2 ** attempt)  # back off before retrying 429/5xx
+
+def url_key(u: str) -> int:
+    """Canonical 64-bit key for a URL (host case, default port, fragment, query order ignored)."""
+    p = urlsplit(u)
+    host = (p.hostname or "").lower()
+    netloc = host if p.port in (None, 80, 443) else f"{host}:{p.port}"
+    query = urlencode(sorted(parse_qsl(p.query)))
+    return xxhash.xxh64_intdigest(f"{netloc}{p.path}?{query}".encode())
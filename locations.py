@@ -1,16 +1,28 @@
-import csv
+import codecs
+import hashlib
+import json
+import logging
 import re
+import sqlite3
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urljoin
-import requests
-from bs4 import BeautifulSoup
+import httpx
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from bs4 import BeautifulSoup, SoupStrainer
+from selectolax.lexbor import LexborHTMLParser
+
+from http_utils import RateLimiter, get_with_retries, make_client, url_key
 
 # -------------- CONFIG --------------
 BASE_URL = "https://www.woodlands.co.uk"
 SEARCH_TPL = "https://www.woodlands.co.uk/buying-a-wood/search?location=HP11SW&page={page}"
 OUT_CSV = Path(r"C:\Users\thoma\OneDrive\Documents\Repositories\Glamping\woodlands_sites.csv")
-REQUEST_DELAY_SEC = 1
+DB_PATH = OUT_CSV.with_name("woodlands.db")  # page index for incremental runs
+MAX_WORKERS = 8        # concurrent in-flight requests
+REQUESTS_PER_SEC = 2   # be polite: global cap shared by all workers
 HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -21,13 +33,30 @@ HEADERS = {
 }
 # ------------------------------------
 
-def get(url: str) -> requests.Response:
-    print(f"[GET] {url}")
-    resp = requests.get(url, headers=HEADERS, timeout=30)
-    return resp
+log = logging.getLogger("scrape")
+
+CSV_SCHEMA = pa.schema([
+    ("Name", pa.string()),
+    ("Price", pa.string()),
+    ("Type", pa.string()),
+    ("Size", pa.string()),
+    ("Latitude", pa.float64()),
+    ("Longitude", pa.float64()),
+    ("GPS_Text", pa.string()),
+    ("URL", pa.string()),
+])
+
+CLIENT = make_client(HEADERS)
+RATE_LIMIT = RateLimiter(REQUESTS_PER_SEC)
+
+def get(url: str, headers: dict | None = None) -> httpx.Response:
+    return get_with_retries(CLIENT, RATE_LIMIT, url, headers)
+
+# Search pages only need the H1 (404 check) and the card anchors
+SEARCH_STRAINER = SoupStrainer(["h1", "a"])
 
-def soup(resp: requests.Response) -> BeautifulSoup:
-    return BeautifulSoup(resp.text, "html.parser")
+def soup(resp: httpx.Response) -> BeautifulSoup:
+    return BeautifulSoup(resp.content, "lxml", parse_only=SEARCH_STRAINER)
 
 def is_404(s: BeautifulSoup, status_code: int) -> bool:
     if status_code == 404:
@@ -37,13 +66,19 @@ def is_404(s: BeautifulSoup, status_code: int) -> bool:
 
 def find_card_links(s: BeautifulSoup) -> list[str]:
     links = [urljoin(BASE_URL, a["href"]) for a in s.select("a.card__link[href]")]
-    print(f"[INFO] Found {len(links)} woodland links on this page.")
-    for link in links:
-        print(f"       -> {link}")
+    log.info(f"[INFO] Found {len(links)} woodland links on this page.")
+    if log.isEnabledFor(logging.DEBUG):
+        for link in links:
+            log.debug(f"       -> {link}")
     return links
 
-def extract_name_price_type(s: BeautifulSoup) -> tuple[str, str, str]:
+GPS_RE = re.compile(r"(-?\d+\.\d+)\s*,\s*(-?\d+\.\d+)")
+
+def extract_detail(tree: LexborHTMLParser) -> dict:
     """
+    Pull name/price/type from the hero H1 and size/GPS from the <li> rows,
+    walking the detail page's <li> elements only once.
+
     <section class="section section--short section--bg-yellow">
       <div class="section__inner">
         <div class="hero">
@@ -55,70 +90,50 @@ def extract_name_price_type(s: BeautifulSoup) -> tuple[str, str, str]:
         </div>
       </div>
     </section>
+    <ul>
+      <li>Hertfordshire</li>
+      <li>about 2 ½ acres</li>
+    </ul>
+    ...
+    <li>GPS coordinates: 51.7061, -0.240244</li>
     """
     # Prefer the exact hero H1; fall back to the first H1 on the page
-    h1 = s.select_one("section.section--bg-yellow h1") or s.select_one("h1")
+    h1 = tree.css_first("section.section--bg-yellow h1") or tree.css_first("h1")
     if not h1:
         raise RuntimeError("h1 not found for name/price/type")
 
-    # Pull spans explicitly
-    spans = h1.select("span.hero__extra")
-    price = spans[0].get_text(strip=True) if len(spans) >= 1 else ""
-    wtype = spans[1].get_text(strip=True) if len(spans) >= 2 else ""
-
-    # Remove spans from a copy, then read the clean name
-    h1_copy = BeautifulSoup(str(h1), "html.parser").h1
-    for sp in h1_copy.find_all("span"):
-        sp.decompose()
-    name = h1_copy.get_text(strip=True)
-
-    print(f"[PARSE] Name: {name} | Price: {price} | Type: {wtype}")
-    return name, price, wtype
+    # Pull spans explicitly; the name is the H1's own text without them
+    spans = h1.css("span.hero__extra")
+    price = spans[0].text(strip=True) if len(spans) >= 1 else ""
+    wtype = spans[1].text(strip=True) if len(spans) >= 2 else ""
+    name = h1.text(deep=False, strip=True)
+    if not name:
+        # Name wrapped in an inline tag: subtract the span texts from the full H1 text
+        name = h1.text(strip=True)
+        for sp in h1.css("span"):
+            name = name.replace(sp.text(strip=True), "", 1)
+        name = name.strip()
+    log.debug(f"[PARSE] Name: {name} | Price: {price} | Type: {wtype}")
 
-def extract_size(s: BeautifulSoup) -> str:
-    """
-    Second <li> in the header details row usually contains the size (e.g., 'about 2 ½ acres').
-    Fallback: any <li> with 'acres' in it.
-    """
-    # Try header metadata list under the title section
-    for ul in s.select("section ul"):
-        lis = ul.find_all("li")
-        if len(lis) >= 2 and "acres" in lis[1].get_text(" ", strip=True).lower():
-            size = lis[1].get_text(" ", strip=True)
-            print(f"[PARSE] Size: {size}")
-            return size
-    # Fallback
-    li = s.find("li", string=lambda t: isinstance(t, str) and "acres" in t.lower())
-    size = li.get_text(" ", strip=True) if li else ""
-    print(f"[PARSE] Size (fallback): {size}")
-    return size
-
-def extract_gps(s: BeautifulSoup) -> tuple[str, float, float]:
-    """
-    Find 'GPS coordinates: 51.7061, -0.240244' and return text + floats.
-    """
-    gps_text = ""
-    for li in s.select("li"):
-        t = li.get_text(" ", strip=True)
-        if t.lower().startswith("gps coordinates"):
+    # Single pass over every <li>: first 'acres' line is the size, 'GPS coordinates: ...' the location
+    size = gps_text = ""
+    for li in tree.css("li"):
+        t = li.text(separator=" ", strip=True)
+        low = t.lower()
+        if not size and "acres" in low:
+            size = t
+        elif not gps_text and low.startswith("gps coordinates"):
             gps_text = t
+        if size and gps_text:
             break
-    search_space = gps_text or s.get_text(" ", strip=True)
-    m = re.search(r"(-?\d+\.\d+)\s*,\s*(-?\d+\.\d+)", search_space)
+    log.debug(f"[PARSE] Size: {size}")
+
+    search_space = gps_text or (tree.body.text(separator=" ", strip=True) if tree.body else "")
+    m = GPS_RE.search(search_space)
     lat = lon = None
     if m:
         lat, lon = float(m.group(1)), float(m.group(2))
-    print(f"[PARSE] GPS: {gps_text} -> lat={lat}, lon={lon}")
-    return gps_text, lat, lon
-
-def scrape_detail(detail_url: str) -> dict:
-    r = get(detail_url)
-    r.raise_for_status()
-    s = soup(r)
-
-    name, price, wtype = extract_name_price_type(s)
-    size = extract_size(s)
-    gps_text, lat, lon = extract_gps(s)
+    log.debug(f"[PARSE] GPS: {gps_text} -> lat={lat}, lon={lon}")
 
     return {
         "Name": name,
@@ -128,57 +143,134 @@ def scrape_detail(detail_url: str) -> dict:
         "Latitude": lat,
         "Longitude": lon,
         "GPS_Text": gps_text,
-        "URL": detail_url,
     }
 
+def open_index(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body_sha1 TEXT,
+            row_json TEXT,
+            scraped_at INTEGER
+        )"""
+    )
+    return conn
+
+def load_index(conn: sqlite3.Connection) -> dict[str, dict]:
+    """Whole index up front, so worker threads never touch the connection."""
+    cur = conn.execute("SELECT url, etag, last_modified, body_sha1, row_json FROM pages")
+    return {
+        url: {"etag": etag, "last_modified": lm, "body_sha1": sha1, "row_json": row_json}
+        for url, etag, lm, sha1, row_json in cur
+    }
+
+def save_index(conn: sqlite3.Connection, records: list[tuple]) -> None:
+    with conn:  # one transaction
+        conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", records)
+
+def scrape_detail(detail_url: str, cached: dict | None = None) -> tuple[dict, tuple | None]:
+    """
+    Scrape one detail page, revalidating against the index entry if there is one.
+    Returns the row plus the index record to store (None when nothing changed).
+    """
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    r = get(detail_url, headers)
+    if r.status_code == 304 and cached:
+        log.debug(f"[CACHE] Not modified: {detail_url}")
+        return json.loads(cached["row_json"]), None
+    r.raise_for_status()
+
+    body_sha1 = hashlib.sha1(r.content).hexdigest()
+    if cached and cached["body_sha1"] == body_sha1:
+        row = json.loads(cached["row_json"])
+    else:
+        row = extract_detail(LexborHTMLParser(r.content))
+        row["URL"] = detail_url
+    record = (
+        detail_url,
+        r.headers.get("ETag"),
+        r.headers.get("Last-Modified"),
+        body_sha1,
+        json.dumps(row, ensure_ascii=False),
+        int(time.time()),
+    )
+    return row, record
+
+def try_scrape_detail(link: str, label: str, cached: dict | None) -> tuple[dict, tuple | None] | None:
+    log.debug(f"=== {label} ===")
+    try:
+        row, record = scrape_detail(link, cached)
+        log.info(f"[OK] {row['Name']} | {row['Price']} | {row['Type']} | {row['Size']}")
+        return row, record
+    except Exception as e:
+        log.error(f"[ERROR] Failed to scrape {link}: {e}")
+        return None
+
 def main():
     OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
-    rows = []
+    conn = open_index(DB_PATH)
+    index = load_index(conn)
+    log.info(f"[INDEX] {len(index)} pages known from previous runs")
+    futures = []
     page = 1
     seen = set()
 
-    while True:
-        search_url = SEARCH_TPL.format(page=page)
-        resp = get(search_url)
-        s = soup(resp)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_search = prefetcher.submit(get, SEARCH_TPL.format(page=page))
+        while True:
+            resp = next_search.result()
+            s = soup(resp)
 
-        if is_404(s, resp.status_code):
-            print(f"[STOP] Page {page} is 404/end of results.")
-            break
+            if is_404(s, resp.status_code):
+                log.info(f"[STOP] Page {page} is 404/end of results.")
+                break
 
-        detail_links = find_card_links(s)
-        if not detail_links:
-            print(f"[STOP] No cards on page {page}.")
-            break
+            detail_links = find_card_links(s)
+            if not detail_links:
+                log.info(f"[STOP] No cards on page {page}.")
+                break
+
+            # Fetch the next results page while this page's details are scraped
+            next_search = prefetcher.submit(get, SEARCH_TPL.format(page=page + 1))
+
+            # Queue this page's details and move straight on; workers are paced by RATE_LIMIT
+            for i, link in enumerate(detail_links, start=1):
+                key = url_key(link)
+                if key in seen:
+                    log.info(f"[SKIP] Already scraped: {link}")
+                    continue
+                seen.add(key)
+                label = f"Page {page} — Woodland {i}/{len(detail_links)}"
+                futures.append(executor.submit(try_scrape_detail, link, label, index.get(link)))
+
+            page += 1
+            log.info(f"[PAGE] Moving to page {page}...")
+
+        # Collected in submission order so the CSV keeps listing order
+        results = [res for res in (f.result() for f in futures) if res]
+    rows = [row for row, _ in results]
+
+    save_index(conn, [record for _, record in results if record])
+    conn.close()
 
-        for i, link in enumerate(detail_links, start=1):
-            if link in seen:
-                print(f"[SKIP] Already scraped: {link}")
-                continue
-            seen.add(link)
-
-            print(f"\n=== Page {page} — Woodland {i}/{len(detail_links)} ===")
-            try:
-                row = scrape_detail(link)
-                print(f"[OK] {row['Name']} | {row['Price']} | {row['Type']} | {row['Size']}")
-                rows.append(row)
-            except Exception as e:
-                print(f"[ERROR] Failed to scrape {link}: {e}")
-            finally:
-                time.sleep(REQUEST_DELAY_SEC)
-
-        page += 1
-        print(f"\n[PAGE] Moving to page {page}...")
-        time.sleep(REQUEST_DELAY_SEC)
-
-    # Write CSV (UTF-8 BOM for Excel-friendly ½)
-    fieldnames = ["Name", "Price", "Type", "Size", "Latitude", "Longitude", "GPS_Text", "URL"]
-    print(f"\n[WRITE] Saving {len(rows)} rows to: {OUT_CSV}")
-    with OUT_CSV.open("w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-    print("[DONE] CSV saved.")
+    # Write CSV via Arrow (UTF-8 BOM for Excel-friendly ½)
+    table = pa.Table.from_pylist(rows, schema=CSV_SCHEMA)
+    log.info(f"[WRITE] Saving {len(rows)} rows to: {OUT_CSV}")
+    with OUT_CSV.open("wb") as f:
+        f.write(codecs.BOM_UTF8)
+        pa_csv.write_csv(table, f, write_options=pa_csv.WriteOptions(include_header=True))
+    log.info("[DONE] CSV saved.")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # we log our own [GET] lines
     main()
@@ -1,18 +1,32 @@
 # map_woodlands.py
-import math
+import html
+import os
 import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from urllib.parse import urlparse, urljoin
 BASE_DIR = Path(__file__).resolve().parent
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 import folium
-from folium.plugins import MarkerCluster
+import pydeck as pdk
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
+from http_utils import RETRY_STATUSES, RateLimiter
+
+try:  # optional: nearest-city search falls back to a brute-force haversine grid
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
 # ----- CONFIG -----
 SITES_CSV = BASE_DIR / "woodlands_sites.csv"
 CITY_CSV  = BASE_DIR / "gb.csv"
@@ -25,51 +39,67 @@ DEFAULT_DISTANCE_MILES_THRESHOLD = 50.0
 st.set_page_config(page_title="Woodlands Map", layout="wide")
 st.title("Woodlands for Sale — Map view")
 
+# --- Helpers for parsing numeric fields from text (fallbacks), column-wide ---
+_DIGITS_RE = re.compile(r"[^\d]")
+_ACRES_RE  = re.compile(r"(\d+(?:\.\d+)?)\s*(?:\+\s*(0\.\d+))?")
+_SLUG_RE   = re.compile(r"[^a-z0-9]+")
+_SITE_ID_RE = re.compile(r"\|site:(\d+)")
+
+def parse_price_to_int(prices: pd.Series) -> pd.Series:
+    digits = prices.astype("string").str.replace(_DIGITS_RE, "", regex=True)
+    return pd.to_numeric(digits, errors="coerce").astype("float64")
+
+FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1/3, "⅔": 2/3}
+def parse_acres(sizes: pd.Series) -> pd.Series:
+    s = sizes.astype("string").str.lower()
+    s = s.str.replace("about", "", regex=False).str.replace("approx", "", regex=False)
+    for k, v in FRACTIONS.items():
+        s = s.str.replace(k, f"+{v}", regex=False)
+    parts = s.str.extract(_ACRES_RE).astype("float64")
+    return (parts[0] + parts[1].fillna(0.0)).astype("float64")
+
 # ---------- Load sites ----------
+# Only the columns the app reads; a callable usecols skips absent ones, so older CSVs still load
+SITE_COLUMNS = {
+    "Name", "Price", "Type", "Size", "URL", "NearestCity", "Latitude", "Longitude",
+    "SizeAcres", "Acres_numeric", "Price_numeric", "Size_m2", "Size_m2_sqrt",
+}
+SITE_DTYPES = {c: "float64" for c in [
+    "Latitude", "Longitude", "SizeAcres", "Acres_numeric", "Price_numeric", "Size_m2", "Size_m2_sqrt",
+]}
+# City CSVs vary (City/Name, Latitude/lat, Longitude/lng); matched case-insensitively below
+CITY_COLUMNS = {"city", "name", "latitude", "lat", "longitude", "lng", "population", "pop"}
+
+def read_cities_csv(src) -> pd.DataFrame:
+    return pd.read_csv(src, usecols=lambda c: c.lower() in CITY_COLUMNS)
+
+@st.cache_data(show_spinner=False)
+def load_sites(path: Path, mtime: float) -> pd.DataFrame:
+    """Read + normalise the sites CSV once per file version (mtime is part of the cache key)."""
+    sites = pd.read_csv(path, encoding="utf-8-sig", usecols=lambda c: c in SITE_COLUMNS, dtype=SITE_DTYPES)
+
+    # Numeric helpers for filters (and backward compatibility)
+    if "Price" in sites.columns and "Price_numeric" not in sites.columns:
+        sites["Price_numeric"] = parse_price_to_int(sites["Price"])
+
+    # Prefer your normalized SizeAcres; fall back to Acres_numeric made from Size text
+    if "SizeAcres" not in sites.columns:
+        if "Acres_numeric" in sites.columns:
+            sites["SizeAcres"] = sites["Acres_numeric"]
+        elif "Size" in sites.columns:
+            sites["SizeAcres"] = parse_acres(sites["Size"])
+    return sites
+
+@st.cache_data(show_spinner=False)
+def load_cities(path: Path, mtime: float) -> pd.DataFrame:
+    """Read the cities CSV once per file version (mtime is part of the cache key)."""
+    return read_cities_csv(path)
+
 if not SITES_CSV.exists():
     st.error(f"Sites CSV not found: {SITES_CSV}")
     st.stop()
 
-sites = pd.read_csv(SITES_CSV, encoding="utf-8-sig")
-
-# Defensive cleaning
-for col in ["Latitude", "Longitude"]:
-    if col in sites.columns:
-        sites[col] = pd.to_numeric(sites[col], errors="coerce")
-
-# --- Helpers for parsing numeric fields from text (fallbacks) ---
-def parse_price_to_int(s):
-    if pd.isna(s):
-        return None
-    digits = re.sub(r"[^\d]", "", str(s))
-    return float(digits) if digits else None
-
-FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1/3, "⅔": 2/3}
-def parse_acres(text):
-    if pd.isna(text):
-        return None
-    s = str(text).lower().replace("about", "").replace("approx", "")
-    for k, v in FRACTIONS.items():
-        s = s.replace(k, f"+{v}")
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:\+\s*(0\.\d+))?", s)
-    if not m:
-        m = re.search(r"(-?\d+(?:\.\d+)?)", s)
-    if m:
-        base = float(m.group(1))
-        frac = float(m.group(2)) if m.lastindex and m.group(2) else 0.0
-        return base + frac
-    return None
-
-# Numeric helpers for filters (and backward compatibility)
-if "Price" in sites.columns and "Price_numeric" not in sites.columns:
-    sites["Price_numeric"] = sites["Price"].apply(parse_price_to_int)
-
-# Prefer your normalized SizeAcres; fall back to Acres_numeric made from Size text
-if "SizeAcres" not in sites.columns:
-    if "Acres_numeric" in sites.columns:
-        sites["SizeAcres"] = sites["Acres_numeric"]
-    elif "Size" in sites.columns:
-        sites["SizeAcres"] = sites["Size"].apply(parse_acres)
+sites = load_sites(SITES_CSV, SITES_CSV.stat().st_mtime)
 
 # ---------- Sidebar: site filters ----------
 st.sidebar.header("Filters — Woodlands")
@@ -115,22 +145,34 @@ else:
 nearest_city_options = sorted([c for c in sites.get("NearestCity", []).dropna().unique()])
 sel_nearest_cities = st.sidebar.multiselect("Nearest City", nearest_city_options, default=nearest_city_options) if nearest_city_options else []
 
-# Apply site-level filters
-f_sites = sites.copy()
+# Apply site-level filters: one boolean mask over plain NumPy columns, then a single row selection
+def in_range(col: str, lo: float, hi: float) -> np.ndarray:
+    """True where sites[col] is within [lo, hi]; missing values pass (they are not filtered out)."""
+    v = sites[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.isnan(v) | ((v >= lo) & (v <= hi))
+
+keep = np.ones(len(sites), dtype=bool)
 if sel_types:
-    f_sites = f_sites[f_sites["Type"].isin(sel_types)]
+    keep &= sites["Type"].isin(sel_types).to_numpy()
 if price_min is not None:
-    f_sites = f_sites[(f_sites["Price_numeric"].isna()) | ((f_sites["Price_numeric"] >= price_min) & (f_sites["Price_numeric"] <= price_max))]
+    keep &= in_range("Price_numeric", price_min, price_max)
 if sel_sa_min is not None:
-    f_sites = f_sites[(f_sites["SizeAcres"].isna()) | ((f_sites["SizeAcres"] >= sel_sa_min) & (f_sites["SizeAcres"] <= sel_sa_max))]
+    keep &= in_range("SizeAcres", sel_sa_min, sel_sa_max)
 if sel_sm2_min is not None:
-    f_sites = f_sites[(f_sites["Size_m2"].isna()) | ((f_sites["Size_m2"] >= sel_sm2_min) & (f_sites["Size_m2"] <= sel_sm2_max))]
+    keep &= in_range("Size_m2", sel_sm2_min, sel_sm2_max)
 if sel_ss_min is not None:
-    f_sites = f_sites[(f_sites["Size_m2_sqrt"].isna()) | ((f_sites["Size_m2_sqrt"] >= sel_ss_min) & (f_sites["Size_m2_sqrt"] <= sel_ss_max))]
+    keep &= in_range("Size_m2_sqrt", sel_ss_min, sel_ss_max)
 if sel_nearest_cities:
-    f_sites = f_sites[f_sites["NearestCity"].isin(sel_nearest_cities)]
+    keep &= sites["NearestCity"].isin(sel_nearest_cities).to_numpy()
+keep &= sites["Latitude"].notna().to_numpy() & sites["Longitude"].notna().to_numpy()
+
+f_sites = sites[keep]
 
-f_sites = f_sites.dropna(subset=["Latitude", "Longitude"]).copy()
+# ---------- Sidebar: map renderer ----------
+use_webgl = st.sidebar.toggle(
+    "WebGL map (pydeck)", value=False,
+    help="Draws every marker on the GPU — much faster with thousands of sites, but without clustering.",
+)
 
 # ---------- Sidebar: city layer with population slider ----------
 st.sidebar.header("Layers — Cities")
@@ -139,12 +181,12 @@ show_cities = st.sidebar.checkbox("Show UK cities", value=True)
 city_df = None
 if show_cities:
     if CITY_CSV.exists():
-        city_df = pd.read_csv(CITY_CSV)
+        city_df = load_cities(CITY_CSV, CITY_CSV.stat().st_mtime)
     else:
         st.sidebar.info("Upload a CSV of cities with columns: City (or Name), Latitude/lat, Longitude/lng, optional Population.")
         upload = st.sidebar.file_uploader("Upload gb.csv", type=["csv"])
         if upload is not None:
-            city_df = pd.read_csv(upload)
+            city_df = read_cities_csv(upload)
 
 # Normalize and filter cities
 filtered_cities = None
@@ -157,19 +199,20 @@ if show_cities and city_df is not None and not city_df.empty:
     pop_col  = cols.get("population") or cols.get("pop")
 
     if name_col and lat_col and lon_col:
-        city_df = city_df.rename(columns={
-            name_col: "City",
-            lat_col:  "Latitude",
-            lon_col:  "Longitude"
-        }).copy()
-
-        if pop_col and pop_col != "Population":
-            city_df.rename(columns={pop_col: "Population"}, inplace=True)
-
-        city_df["Latitude"]  = pd.to_numeric(city_df["Latitude"], errors="coerce")
-        city_df["Longitude"] = pd.to_numeric(city_df["Longitude"], errors="coerce")
+        renames = {name_col: "City", lat_col: "Latitude", lon_col: "Longitude"}
+        if pop_col:
+            renames[pop_col] = "Population"
+        city_df = city_df.rename(columns=renames)
+
+        # One cast for all numeric columns (a no-op for gb.csv, which already parses as numbers);
+        # only files with stray text need the slower coercing path
+        numeric = {"Latitude": "float64", "Longitude": "float64"}
         if "Population" in city_df.columns:
-            city_df["Population"] = pd.to_numeric(city_df["Population"], errors="coerce")
+            numeric["Population"] = "Int64"
+        try:
+            city_df = city_df.astype(numeric)
+        except (TypeError, ValueError):
+            city_df[list(numeric)] = city_df[list(numeric)].apply(pd.to_numeric, errors="coerce")
 
         # ---- population slider (only if we have it) ----
         st.sidebar.subheader("City filters")
@@ -180,80 +223,103 @@ if show_cities and city_df is not None and not city_df.empty:
             filtered_cities = city_df[
                 (city_df["Population"].isna()) |
                 ((city_df["Population"] >= sel_pmin) & (city_df["Population"] <= sel_pmax))
-            ].copy()
+            ]
         else:
             st.sidebar.caption("No population column found — showing all cities.")
-            filtered_cities = city_df.copy()
+            filtered_cities = city_df
 
-        filtered_cities = filtered_cities.dropna(subset=["Latitude", "Longitude"]).copy()
+        filtered_cities = filtered_cities.dropna(subset=["Latitude", "Longitude"])
     else:
         st.warning("City CSV must have columns: City (or Name), Latitude/lat, Longitude/lng (Population optional).")
         filtered_cities = None
 
+# City coordinates as one float array, reused by the distance + marker code below
+city_coords = (
+    None if filtered_cities is None or filtered_cities.empty
+    else filtered_cities[["Latitude", "Longitude"]].to_numpy(dtype=np.float64)
+)
+
 # ---------- Distance filtering to (filtered) cities ----------
 st.sidebar.header("Distance to cities")
 enable_distance_filter = st.sidebar.checkbox("Enable distance filter to nearest (filtered) city", value=False)
 distance_threshold = st.sidebar.slider("Max distance to city (miles)", 5, 150, int(DEFAULT_DISTANCE_MILES_THRESHOLD), step=5)
 
-def haversine_miles(lat1, lon1, lat2, lon2):
-    R = 3958.7613  # miles
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi       = math.radians(lat2 - lat1)
-    dlambda    = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2.0)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2.0)**2
-    return 2 * R * math.asin(math.sqrt(a))
-
-def annotate_min_distance_to_cities(sites_df: pd.DataFrame, cities_df: pd.DataFrame) -> pd.DataFrame:
+EARTH_RADIUS_MILES = 3958.7613
+
+def unit_sphere_xyz(latlon_deg: np.ndarray) -> np.ndarray:
+    """(n, 2) lat/lon in degrees -> (n, 3) points on the unit sphere."""
+    lat, lon = np.radians(latlon_deg).T
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+def min_haversine_grid(site_coords: np.ndarray, city_coords: np.ndarray) -> np.ndarray:
+    """Fallback without scipy: haversine over the full (n_sites, n_cities) grid, min per site."""
+    lat_s, lon_s = np.radians(site_coords).T
+    lat_c, lon_c = np.radians(city_coords).T
+    dphi = lat_s[:, None] - lat_c[None, :]
+    dlam = lon_s[:, None] - lon_c[None, :]
+    a = np.sin(dphi / 2.0) ** 2 + np.cos(lat_s)[:, None] * np.cos(lat_c)[None, :] * np.sin(dlam / 2.0) ** 2
+    return (2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))).min(axis=1)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_city_tree(city_coords_bytes: bytes):
+    """KD-tree over the cities' unit-sphere points, reused while the filtered city set is unchanged."""
+    city_coords = np.frombuffer(city_coords_bytes, dtype=np.float64).reshape(-1, 2)
+    return cKDTree(unit_sphere_xyz(city_coords))
+
+def min_city_miles(site_coords: np.ndarray, city_coords: np.ndarray) -> np.ndarray:
+    """Great-circle miles from each site to its nearest city."""
+    if cKDTree is None:
+        return min_haversine_grid(site_coords, city_coords)
+    # Nearest by straight-line chord on the unit sphere == nearest by great-circle distance
+    tree = build_city_tree(np.ascontiguousarray(city_coords, dtype=np.float64).tobytes())
+    chord, _ = tree.query(unit_sphere_xyz(site_coords), k=1, workers=-1)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+def annotate_min_distance_to_cities(sites_df: pd.DataFrame, city_coords: np.ndarray | None) -> pd.DataFrame:
     """Adds MinCityMiles = min distance in miles to any (filtered) city."""
-    if cities_df is None or cities_df.empty:
-        sites_df = sites_df.copy()
-        sites_df["MinCityMiles"] = None
-        return sites_df
-
-    cities_list = [(float(r["Latitude"]), float(r["Longitude"])) for _, r in cities_df.iterrows()]
-    mins = []
-    for _, row in sites_df.iterrows():
-        lat_s, lon_s = float(row["Latitude"]), float(row["Longitude"])
-        md = None
-        for (clat, clon) in cities_list:
-            d = haversine_miles(lat_s, lon_s, clat, clon)
-            md = d if (md is None or d < md) else md
-        mins.append(md)
-    out = sites_df.copy()
-    out["MinCityMiles"] = mins
-    return out
+    if city_coords is None or len(city_coords) == 0:
+        return sites_df.assign(MinCityMiles=np.full(len(sites_df), np.nan))
+
+    site_coords = sites_df[["Latitude", "Longitude"]].to_numpy(dtype=np.float64)
+    # assign() hands back a new frame, so callers never write into a filtered view
+    return sites_df.assign(MinCityMiles=min_city_miles(site_coords, city_coords))
 
 if enable_distance_filter:
     if filtered_cities is None or filtered_cities.empty:
         st.warning("No (filtered) cities available — distance filter is disabled.")
     else:
-        f_sites = annotate_min_distance_to_cities(f_sites, filtered_cities)
+        f_sites = annotate_min_distance_to_cities(f_sites, city_coords)
         before = len(f_sites)
-        f_sites = f_sites[(f_sites["MinCityMiles"].notna()) & (f_sites["MinCityMiles"] <= distance_threshold)].copy()
+        f_sites = f_sites[(f_sites["MinCityMiles"].notna()) & (f_sites["MinCityMiles"] <= distance_threshold)]
         st.sidebar.caption(f"Filtered by distance: kept {len(f_sites)} of {before} woodlands (≤ {int(distance_threshold)} miles).")
 else:
-    if filtered_cities is not None and not filtered_cities.empty:
-        # compute for display in popups/table
-        f_sites = annotate_min_distance_to_cities(f_sites, filtered_cities)
+    if show_cities and filtered_cities is not None and not filtered_cities.empty:
+        # Display only (popups/table). Every filtered site is annotated: the popup HTML must not
+        # depend on the viewport, or st_folium re-keys the map and snaps it back on each pan/zoom.
+        f_sites = annotate_min_distance_to_cities(f_sites, city_coords)
     else:
-        f_sites["MinCityMiles"] = None
+        # Nothing to show the distance against: a float NaN column, no O(n·m) work
+        f_sites = f_sites.assign(MinCityMiles=np.full(len(f_sites), np.nan))
 
 # ---------- Map ----------
-m = folium.Map(location=UK_CENTER, zoom_start=UK_ZOOM, control_scale=True, prefer_canvas=True)
-
-# Woodlands layer
-woodlands_group = folium.FeatureGroup(name="Woodlands", show=True).add_to(m)
-woodland_cluster = MarkerCluster().add_to(woodlands_group)
-
-def html_popup_site(row):
-    name = row.get("Name", "Unknown")
-    price = row.get("Price", "")
-    typ = row.get("Type", "")
-    size = row.get("Size", "")
-    url = row.get("URL", "")
-    dmi = row.get("MinCityMiles", None)
-    dm_txt = f"<div>Nearest filtered city: {dmi:.1f} miles</div>" if pd.notna(dmi) else ""
+def marker_callback(icon: str, color: str, max_width: int) -> str:
+    """FastMarkerCluster JS callback for data rows of [lat, lon, popup_html, tooltip_html].
+    st_folium only reports a clicked marker's tooltip text (the popup arrives empty when bound
+    as a string), so anything the click handler needs has to be in the tooltip."""
     return f"""
+    function (row) {{
+        var icon = L.AwesomeMarkers.icon({{icon: "{icon}", prefix: "glyphicon", markerColor: "{color}"}});
+        var marker = L.marker(new L.LatLng(row[0], row[1]), {{icon: icon}});
+        marker.bindPopup(row[2], {{maxWidth: {max_width}}});
+        marker.bindTooltip(row[3]);
+        return marker;
+    }}
+    """
+
+def column_list(df: pd.DataFrame, col: str, default="") -> list:
+    return df[col].tolist() if col in df.columns else [default] * len(df)
+
+SITE_POPUP_TEMPLATE = """
     <div style="font-family: system-ui; font-size: 14px">
       <div style="font-weight: 600; font-size: 16px; margin-bottom: 4px;">{name}</div>
       <div>{price} &nbsp;•&nbsp; {typ}</div>
@@ -263,46 +329,134 @@ def html_popup_site(row):
     </div>
     """
 
-for _, row in f_sites.iterrows():
-    lat, lon = float(row["Latitude"]), float(row["Longitude"])
-    folium.Marker(
-        location=(lat, lon),
-        tooltip=row.get("Name", ""),
-        popup=folium.Popup(html_popup_site(row), max_width=350),
-        icon=folium.Icon(icon="tree-conifer", color="green"),
-    ).add_to(woodland_cluster)
+# Site name for the hover tooltip, plus the row's index label (hidden) for click-to-row lookup
+SITE_TOOLTIP_TEMPLATE = '{name}<span style="display:none">|site:{idx}</span>'
 
-# Cities layer
-if show_cities and filtered_cities is not None and not filtered_cities.empty:
-    cities_group = folium.FeatureGroup(name="Cities", show=True).add_to(m)
-    cities_cluster = MarkerCluster().add_to(cities_group)
-
-    def html_popup_city(row):
-        city = row.get("City", "City")
-        pop  = row.get("Population", None)
-        extra = f"<div>Population: {int(pop):,}</div>" if pd.notna(pop) else ""
-        return f"""
-        <div style="font-family: system-ui; font-size: 14px">
-          <div style="font-weight: 600; font-size: 16px; margin-bottom: 4px;">{city}</div>
-          {extra}
-        </div>
-        """
-
-    for _, r in filtered_cities.iterrows():
-        folium.Marker(
-            location=(float(r["Latitude"]), float(r["Longitude"])),
-            tooltip=str(r.get("City", "")),
-            popup=folium.Popup(html_popup_city(r), max_width=300),
-            icon=folium.Icon(icon="info-sign", color="blue"),
-        ).add_to(cities_cluster)
-
-# Layer control to toggle Woodlands / Cities
-folium.LayerControl(collapsed=False).add_to(m)
+def site_tooltips(df: pd.DataFrame) -> list[str]:
+    return [
+        SITE_TOOLTIP_TEMPLATE.format(name=html.escape(str(name)), idx=idx)
+        for idx, name in zip(df.index, column_list(df, "Name"))
+    ]
+
+def site_popups(df: pd.DataFrame) -> list[str]:
+    """Popup HTML for every site in one pass over plain column lists."""
+    return [
+        SITE_POPUP_TEMPLATE.format(
+            name=name, price=price, typ=typ, size=size, url=url,
+            dm_txt=f"<div>Nearest filtered city: {dmi:.1f} miles</div>" if pd.notna(dmi) else "",
+        )
+        for name, price, typ, size, url, dmi in zip(
+            column_list(df, "Name", "Unknown"), column_list(df, "Price"), column_list(df, "Type"),
+            column_list(df, "Size"), column_list(df, "URL"), column_list(df, "MinCityMiles", None),
+        )
+    ]
+
+CITY_POPUP_TEMPLATE = """
+    <div style="font-family: system-ui; font-size: 14px">
+      <div style="font-weight: 600; font-size: 16px; margin-bottom: 4px;">{city}</div>
+      {extra}
+    </div>
+    """
+
+def build_folium_map(sites_df: pd.DataFrame, cities_df: pd.DataFrame | None) -> folium.Map:
+    """Clustered Leaflet map: markers are created client-side from one JSON array per layer."""
+    m = folium.Map(location=UK_CENTER, zoom_start=UK_ZOOM, control_scale=True, prefer_canvas=True)
+
+    # Woodlands layer
+    woodlands_group = folium.FeatureGroup(name="Woodlands", show=True).add_to(m)
+    # One JSON array of rows; markers are created client-side instead of one folium.Marker each
+    site_coords = sites_df[["Latitude", "Longitude"]].to_numpy(dtype=np.float64)
+    site_markers = [
+        [lat, lon, popup, tooltip]
+        for (lat, lon), popup, tooltip in zip(site_coords, site_popups(sites_df), site_tooltips(sites_df))
+    ]
+    FastMarkerCluster(
+        data=site_markers, callback=marker_callback("tree-conifer", "green", 350)
+    ).add_to(woodlands_group)
+
+    # Cities layer
+    if cities_df is not None and not cities_df.empty:
+        cities_group = folium.FeatureGroup(name="Cities", show=True).add_to(m)
+
+        city_coords = cities_df[["Latitude", "Longitude"]].to_numpy(dtype=np.float64)
+        city_names = column_list(cities_df, "City", "City")
+        city_popups = [
+            CITY_POPUP_TEMPLATE.format(
+                city=city, extra=f"<div>Population: {int(pop):,}</div>" if pd.notna(pop) else ""
+            )
+            for city, pop in zip(city_names, column_list(cities_df, "Population", None))
+        ]
+        city_markers = [
+            [lat, lon, popup, str(city)]
+            for (lat, lon), popup, city in zip(city_coords, city_popups, city_names)
+        ]
+        FastMarkerCluster(
+            data=city_markers, callback=marker_callback("info-sign", "blue", 300)
+        ).add_to(cities_group)
+
+    # Layer control to toggle Woodlands / Cities
+    folium.LayerControl(collapsed=False).add_to(m)
+    return m
+
+def render_deck_map(sites_df: pd.DataFrame, cities_df: pd.DataFrame | None):
+    """WebGL map: one ScatterplotLayer per dataset, so the browser draws a single buffer
+    instead of thousands of DOM markers. Returns the index label of the clicked site (or None)."""
+    def text(values, fmt="{}"):
+        return [fmt.format(v) if pd.notna(v) and v != "" else "" for v in values]
+
+    # Tooltip fields are shared by both layers: Name / Info / Dist
+    site_data = pd.DataFrame({
+        "idx": sites_df.index,
+        "Latitude": sites_df["Latitude"].to_numpy(dtype=np.float64),
+        "Longitude": sites_df["Longitude"].to_numpy(dtype=np.float64),
+        "Name": text(column_list(sites_df, "Name", "Unknown")),
+        "Info": [" • ".join(t for t in parts if t) for parts in zip(
+            text(column_list(sites_df, "Price")), text(column_list(sites_df, "Type")), text(column_list(sites_df, "Size")),
+        )],
+        "Dist": text(column_list(sites_df, "MinCityMiles", None), "Nearest filtered city: {:.1f} miles"),
+    })
+    layers = [pdk.Layer(
+        "ScatterplotLayer", data=site_data, id="woodlands", pickable=True,
+        get_position="[Longitude, Latitude]", get_fill_color=[34, 139, 34, 200],
+        get_radius=500, radius_min_pixels=4, radius_max_pixels=12,
+    )]
+    if cities_df is not None and not cities_df.empty:
+        city_data = pd.DataFrame({
+            "Latitude": cities_df["Latitude"].to_numpy(dtype=np.float64),
+            "Longitude": cities_df["Longitude"].to_numpy(dtype=np.float64),
+            "Name": text(column_list(cities_df, "City", "City")),
+            "Info": text(column_list(cities_df, "Population", None), "Population: {:,.0f}"),
+            "Dist": "",
+        })
+        layers.append(pdk.Layer(
+            "ScatterplotLayer", data=city_data, id="cities", pickable=True,
+            get_position="[Longitude, Latitude]", get_fill_color=[30, 90, 200, 160],
+            get_radius=800, radius_min_pixels=3, radius_max_pixels=10,
+        ))
+
+    deck = pdk.Deck(
+        layers=layers,
+        initial_view_state=pdk.ViewState(latitude=UK_CENTER[0], longitude=UK_CENTER[1], zoom=UK_ZOOM),
+        tooltip={"html": "<b>{Name}</b><br/>{Info}<br/>{Dist}", "style": {"fontFamily": "system-ui"}},
+    )
+    event = st.pydeck_chart(deck, height=720, on_select="rerun", selection_mode="single-object", key="deck_map")
+    picked = event.selection.get("objects", {}).get("woodlands") or []
+    return picked[0]["idx"] if picked else None
 
 sites_count  = len(f_sites)
 cities_count = 0 if not (show_cities and filtered_cities is not None) else len(filtered_cities)
 st.caption(f"Woodlands: {sites_count}  |  Cities (after population filter): {cities_count}")
-st_data = st_folium(m, width=None, height=720)
+map_cities = filtered_cities if show_cities else None
+deck_clicked = None
+if use_webgl:
+    st_data = None
+    deck_clicked = render_deck_map(f_sites, map_cities)
+else:
+    # Only the clicked marker's tooltip is used; not returning bounds/zoom avoids a rerun per pan
+    st_data = st_folium(
+        build_folium_map(f_sites, map_cities), width=None, height=720,
+        returned_objects=["last_object_clicked_tooltip"],
+    )
 
 # ---------- Tables ----------
 with st.expander("Show woodlands table"):
@@ -328,6 +482,21 @@ HEADERS_DL = {
                   "Chrome/124.0 Safari/537.36",
     "Accept-Language": "en-GB,en;q=0.9",
 }
+BULK_WORKERS = 6          # concurrent PDF fetches
+DL_REQUESTS_PER_SEC = 5   # same pace as the old 0.2 s sleep between fetches
+DL_RATE_LIMIT = RateLimiter(DL_REQUESTS_PER_SEC)
+
+@st.cache_resource(show_spinner=False)
+def http_session() -> requests.Session:
+    """One keep-alive connection pool shared by every PDF fetch (and every rerun)."""
+    session = requests.Session()
+    session.headers.update(HEADERS_DL)
+    retry = Retry(total=3, backoff_factor=0.3,
+                  status_forcelist=sorted(RETRY_STATUSES), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 def slug_from_url(u: str) -> str | None:
     try:
@@ -338,59 +507,85 @@ def slug_from_url(u: str) -> str | None:
 
 def sanitize_name_for_match(name: str) -> str:
     s = name.lower().strip()
-    s = re.sub(r"[^a-z0-9]+", "-", s)
-    s = re.sub(r"-+", "-", s).strip("-")
-    return s
-
-def find_local_pdf(row) -> Path | None:
+    return _SLUG_RE.sub("-", s).strip("-")
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def index_local_pdfs(folder: Path, mtime: float) -> tuple[list[tuple[Path, str]], dict[str, list[Path]]]:
+    """Scan the PDFs folder once per folder version (mtime is part of the cache key).
+    Returns (path, lowercased stem) pairs for substring matching plus a stem -> paths bucket."""
+    stems, by_stem = [], {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                p = Path(entry.path)
+                stem = p.stem.lower()
+                stems.append((p, stem))
+                by_stem.setdefault(stem, []).append(p)
+    return stems, by_stem
+
+def local_pdf_index():
+    return index_local_pdfs(PDFS_DIR, PDFS_DIR.stat().st_mtime)
+
+def find_local_pdf(row, pdf_index=None) -> Path | None:
     """Try to locate a PDF in the PDFs folder for a given row."""
+    stems, by_stem = pdf_index or local_pdf_index()
     slug = (slug_from_url(row.get("URL", "")) or "").lower()
+    # An exact stem hit is already the shortest possible match
+    if slug in by_stem:
+        return min(by_stem[slug], key=lambda p: len(p.name))
+
     candidates = []
     if slug:
-        for p in PDFS_DIR.glob("*.pdf"):
-            if slug in p.stem.lower():
-                candidates.append(p)
+        candidates = [p for p, stem in stems if slug in stem]
 
     if not candidates:
         name_key = sanitize_name_for_match(row.get("Name", ""))
-        for p in PDFS_DIR.glob("*.pdf"):
-            if name_key and name_key in p.stem.lower():
-                candidates.append(p)
+        if name_key:
+            candidates = [p for p, stem in stems if name_key in stem]
 
     if not candidates:
         return None
-    candidates.sort(key=lambda p: len(p.name))
-    return candidates[0]
+    return min(candidates, key=lambda p: len(p.name))
+
+def download_pdf(detail_url: str, session: requests.Session | None = None) -> Path:
+    """Visit the woodland page, find the 'Download PDF Details' link, download to PDFs folder.
+    No Streamlit calls when `session` is passed in, so it is safe to run from worker threads."""
+    session = session or http_session()
+    DL_RATE_LIMIT.wait()
+    r = session.get(detail_url, timeout=30)
+    r.raise_for_status()
+    s = BeautifulSoup(r.text, "html.parser")
+
+    a = None
+    for aa in s.select("a[href]"):
+        if "download pdf details" in aa.get_text(strip=True).lower():
+            a = aa
+            break
+    if not a:
+        a = s.select_one('a[href$=".pdf"]')
+    if not a:
+        raise LookupError("Could not locate a PDF link on the page.")
+
+    pdf_url = urljoin(detail_url, a["href"])
+    pdf_name = Path(urlparse(pdf_url).path).name or "details.pdf"
+    dest = PDFS_DIR / pdf_name
+
+    DL_RATE_LIMIT.wait()
+    # Context manager hands the connection back to the pool once the body is read
+    with session.get(pdf_url, timeout=60, stream=True) as rr:
+        rr.raise_for_status()
+        rr.raw.decode_content = True  # undo any gzip transfer-encoding, as iter_content did
+        with open(dest, "wb") as f:
+            shutil.copyfileobj(rr.raw, f, length=1024 * 1024)
+    return dest
 
 def fetch_pdf_to_folder(detail_url: str) -> Path | None:
-    """Visit the woodland page, find the 'Download PDF Details' link, download to PDFs folder."""
+    """download_pdf for the UI thread: failures are shown in the app instead of raised."""
     try:
-        r = requests.get(detail_url, headers=HEADERS_DL, timeout=30)
-        r.raise_for_status()
-        s = BeautifulSoup(r.text, "html.parser")
-
-        a = None
-        for aa in s.select("a[href]"):
-            if "download pdf details" in aa.get_text(strip=True).lower():
-                a = aa
-                break
-        if not a:
-            a = s.select_one('a[href$=".pdf"]')
-        if not a:
-            st.warning("Could not locate a PDF link on the page.")
-            return None
-
-        pdf_url = urljoin(detail_url, a["href"])
-        pdf_name = Path(urlparse(pdf_url).path).name or "details.pdf"
-        dest = PDFS_DIR / pdf_name
-
-        rr = requests.get(pdf_url, headers=HEADERS_DL, timeout=60, stream=True)
-        rr.raise_for_status()
-        with open(dest, "wb") as f:
-            for chunk in rr.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        return dest
+        return download_pdf(detail_url)
+    except LookupError as e:
+        st.warning(str(e))
+        return None
     except Exception as e:
         st.error(f"PDF fetch failed: {e}")
         return None
@@ -399,15 +594,13 @@ def fetch_pdf_to_folder(detail_url: str) -> Path | None:
 st.subheader("Download listing PDF")
 
 clicked = None
-if st_data and st_data.get("last_object_clicked_popup"):
-    # Extract site name from popup HTML
-    popup_html = st_data["last_object_clicked_popup"]
-    match = re.search(r'<div[^>]*>([^<]+)</div>', popup_html)
-    if match:
-        clicked_name = match.group(1).strip()
-        row = f_sites[f_sites["Name"] == clicked_name]
-        if not row.empty:
-            clicked = row.iloc[0]
+if deck_clicked is not None and deck_clicked in f_sites.index:
+    clicked = f_sites.loc[deck_clicked]
+elif st_data and st_data.get("last_object_clicked_tooltip"):
+    # Site tooltips carry the row's index label (see SITE_TOOLTIP_TEMPLATE): direct .loc lookup
+    match = _SITE_ID_RE.search(st_data["last_object_clicked_tooltip"])
+    if match and int(match.group(1)) in f_sites.index:
+        clicked = f_sites.loc[int(match.group(1))]
 
 if clicked is not None:
     chosen_row = clicked
@@ -416,7 +609,8 @@ else:
     if f_sites.empty:
         st.info("No woodlands in the current filter.")
         st.stop()
-    display_options = [f'{row["Name"]}  —  {row.get("Price","")}' for _, row in f_sites.iterrows()]
+    prices = f_sites["Price"] if "Price" in f_sites.columns else [""] * len(f_sites)
+    display_options = [f"{name}  —  {price}" for name, price in zip(f_sites["Name"], prices)]
     choice = st.selectbox(
         "Select a woodland",
         options=list(range(len(display_options))),
@@ -463,7 +657,7 @@ with colB:
 
 
 # ================== BULK PDF DOWNLOAD (max 30) ==================
-import io, zipfile, time
+import tempfile, zipfile
 from datetime import datetime
 
 st.subheader("Bulk download PDFs (max 30)")
@@ -480,67 +674,76 @@ else:
         st.dataframe(f_sites.head(int(n_to_fetch))[["Name", "Price", "Type", "URL"]], use_container_width=True)
 
     if st.button(f"Fetch and bundle up to {int(n_to_fetch)} PDFs", use_container_width=True):
-        subset = f_sites.head(int(n_to_fetch)).copy()
+        subset = f_sites.head(int(n_to_fetch))
 
         progress = st.progress(0)
         status = st.empty()
 
-        saved_paths = []
-        skipped = 0
+        # Resolved here: worker threads have no Streamlit context for the cached helpers
+        pdf_index = local_pdf_index()
+        session = http_session()
+
+        def local_or_download(row) -> Path | None:
+            # 1) try local, 2) fetch into folder
+            p = find_local_pdf(row, pdf_index)
+            if p is None or not p.exists():
+                p = download_pdf(row.get("URL", ""), session)
+            return p if p and p.exists() else None
+
+        records = subset.to_dict("records")
+        results = [None] * len(records)
         errors = 0
 
-        for idx, (_, row) in enumerate(subset.iterrows(), start=1):
-            name = row.get("Name", f"site_{idx}")
-            url  = row.get("URL", "")
-            status.write(f"Processing {idx}/{int(n_to_fetch)}: **{name}**")
-
-            try:
-                # 1) try local
-                p = find_local_pdf(row)
-                if p is None or not p.exists():
-                    # 2) fetch into folder
-                    p = fetch_pdf_to_folder(url)
-                if p and p.exists():
-                    saved_paths.append(p)
-                else:
+        # Fetch concurrently (paced by DL_RATE_LIMIT); Streamlit calls stay on this thread
+        with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+            futures = {executor.submit(local_or_download, row): i for i, row in enumerate(records)}
+            for done, fut in enumerate(as_completed(futures), start=1):
+                i = futures[fut]
+                name = records[i].get("Name", f"site_{i + 1}")
+                status.write(f"Processed {done}/{len(records)}: **{name}**")
+                try:
+                    results[i] = fut.result()
+                    if results[i] is None:
+                        errors += 1
+                except Exception as e:
                     errors += 1
-            except Exception as e:
-                errors += 1
-                st.warning(f"Failed on {name}: {e}")
+                    st.warning(f"Failed on {name}: {e}")
+                progress.progress(done / float(len(records)))
 
-            progress.progress(idx / float(n_to_fetch))
-            # be polite to remote server if fetching
-            time.sleep(0.2)
+        saved_paths = [p for p in results if p is not None]
 
         if not saved_paths:
             st.error("No PDFs found or fetched.")
         else:
-            # Build an in-memory ZIP
-            buf = io.BytesIO()
-            with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                # Avoid duplicate names inside the zip
-                used_names = set()
-                for p in saved_paths:
-                    arcname = p.name
-                    # If duplicate, add an index suffix
-                    base, ext = Path(arcname).stem, Path(arcname).suffix
-                    k = 1
-                    while arcname in used_names:
-                        arcname = f"{base}_{k}{ext}"
-                        k += 1
-                    used_names.add(arcname)
-                    zf.write(p, arcname)
-            buf.seek(0)
-
-            zip_name = f"woodland_pdfs_{datetime.now():%Y%m%d_%H%M%S}.zip"
-            st.success(f"Prepared {len(saved_paths)} PDFs (errors: {errors}).")
-            st.download_button(
-                label=f"Download ZIP ({zip_name})",
-                data=buf.getvalue(),
-                file_name=zip_name,
-                mime="application/zip",
-                use_container_width=True
-            )
+            # Build the ZIP in an anonymous temp file (removed on close) and read it back once:
+            # st.download_button only takes bytes-like data or a read-only file, so this is the
+            # single in-memory copy. PDFs are already compressed, so the fastest deflate level
+            # loses next to nothing.
+            with tempfile.TemporaryFile(suffix=".zip") as tmp:
+                with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                    # Avoid duplicate names inside the zip
+                    used_names = set()
+                    for p in saved_paths:
+                        arcname = p.name
+                        # If duplicate, add an index suffix
+                        base, ext = Path(arcname).stem, Path(arcname).suffix
+                        k = 1
+                        while arcname in used_names:
+                            arcname = f"{base}_{k}{ext}"
+                            k += 1
+                        used_names.add(arcname)
+                        zf.write(p, arcname)
+                tmp.seek(0)
+
+                zip_name = f"woodland_pdfs_{datetime.now():%Y%m%d_%H%M%S}.zip"
+                st.success(f"Prepared {len(saved_paths)} PDFs (errors: {errors}).")
+                st.download_button(
+                    label=f"Download ZIP ({zip_name})",
+                    data=tmp.read(),
+                    file_name=zip_name,
+                    mime="application/zip",
+                    use_container_width=True
+                )
 # ================================================================
 
 # ======================================================= C:/Python313/python.exe -m streamlit run map_woodlands.py